@@ -9,21 +9,34 @@ build_index.py
 """
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import functools
 from pathlib import Path
+import gzip
 import json
-import re
-import datetime as _dt
-import webbrowser
+import os
 import sys
+from html import escape
+from string import Template
+from urllib.parse import quote
+
+try:  # 選用：有裝 orjson 就直接輸出 UTF-8 bytes
+    import orjson
+except ImportError:
+    orjson = None
 
 # ===== 可調參數 =====
 IMAGE_BASENAME = "title"
 IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
 EXCLUDE_DIR_PREFIXES = (".", "_")     # 跳過 .git、_assets……
 ONLY_IMMEDIATE_CHILDREN = True        # True=只掃描第一層子資料夾
+PARALLEL_MIN_DIRS = 64                # 需掃描的子資料夾達此數量才用執行緒池並行
 SORT_DESC = True                      # True=新到舊
 OUTPUT_JSON = "data.json"
+WRITE_JSON_GZIP = False               # True=另輸出預先壓縮的 data.json.gz（供支援 gzip_static 的伺服器）
 OUTPUT_HTML = "index.html"            # 建議首頁用 index.html (非 _index.html)
+OUTPUT_STANDALONE_HTML = None         # 設檔名（如 "standalone.html"）則另輸出內嵌卡片、不需 fetch 的版本
+CACHE_FILE = ".build_index_cache.json"  # 記錄各子資料夾掃描結果，未變動就不重掃；None=停用
 CREATE_NOJEKYLL = True                # 在根目錄建立 .nojekyll
 AUTO_OPEN_AFTER_BUILD = True          # 生成後自動用瀏覽器開啟 index.html
 PAGE_TITLE = "我的縮圖首頁"
@@ -34,69 +47,154 @@ SITE_SUB = "點縮圖會開子資料夾的 _index.html"
 
 ROOT = Path.cwd()
 
-
-def find_title_image(folder: Path) -> Path | None:
-    """在 folder 找檔名為 'title' 的圖片（大小寫不拘、副檔名依 IMAGE_EXTS）。"""
-    # 先試精準組合
-    for ext in IMAGE_EXTS:
-        candidate = folder / f"{IMAGE_BASENAME}{ext}"
-        if candidate.exists():
-            return candidate
-    # 再寬鬆大小寫比對
-    for f in folder.iterdir():
-        if f.is_file() and f.suffix.lower() in IMAGE_EXTS and f.stem.lower() == IMAGE_BASENAME:
-            return f
-    return None
-
-
-def link_target(folder: Path) -> Path:
-    """優先連到 _index.html；若不存在，連到資料夾本身。"""
-    idx = folder / "_index.html"
-    return idx if idx.exists() else folder
-
-
-_date_re = re.compile(r"^(\d{8})")
+# 小寫檔名 → IMAGE_EXTS 中的順位（越小越優先），讓比對只需一次 dict 查詢
+_TITLE_RANK = {f"{IMAGE_BASENAME}{ext}": i for i, ext in enumerate(IMAGE_EXTS)}
+
+
+def _iter_subdirs(root):
+    """以 os.scandir 列出 root 的第一層子資料夾（DirEntry），已排除特定前綴。"""
+    with os.scandir(root) as it:
+        for e in it:
+            if not e.name.startswith(EXCLUDE_DIR_PREFIXES) and e.is_dir(follow_symlinks=False):
+                yield e
+
+
+def _all_subdirs(root):
+    """以 os.walk 遞迴列出 root 下所有子資料夾（Path）；排除的資料夾連同其內容都不進入。
+
+    與 _iter_subdirs 一致，不列入指向資料夾的符號連結。
+    """
+    for dirpath, dirnames, _ in os.walk(root, followlinks=False):
+        # 就地修改 dirnames，os.walk 才不會往下走進 .git、_assets……
+        dirnames[:] = [
+            n for n in dirnames
+            if not n.startswith(EXCLUDE_DIR_PREFIXES) and not os.path.islink(os.path.join(dirpath, n))
+        ]
+        base = Path(dirpath)
+        for n in dirnames:
+            yield base / n
+
+
+def find_title_image(folder_path: str) -> tuple[str | None, bool]:
+    """在 folder_path 找檔名為 'title' 的圖片（大小寫不拘、副檔名依 IMAGE_EXTS）。
+
+    回傳 (圖片檔名或 None, 是否有 _index.html)。只讀一次目錄；有多張時以
+    IMAGE_EXTS 的順序優先，第一順位與 _index.html 都找到即提早結束。
+    """
+    best = None
+    best_rank = len(IMAGE_EXTS)
+    has_index = False
+    with os.scandir(folder_path) as it:
+        for e in it:
+            # 一般檔案的型別資訊來自 readdir，不需額外 stat；符號連結（如 title.jpg -> 某張照片）才需跟隨一次
+            if not e.is_file():
+                continue
+            name = e.name
+            if name == "_index.html":
+                has_index = True
+            else:
+                rank = _TITLE_RANK.get(name.lower())
+                if rank is None:
+                    continue
+                if rank < best_rank:
+                    best, best_rank = name, rank
+            if best_rank == 0 and has_index:
+                break
+    return best, has_index
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_ymd_prefix(prefix: str):
+    """把 8 字元的 YYYYMMDD 前綴轉成 (年, 月, 日)；不合法則為 (0, 0, 0)。同一天的資料夾共用快取。"""
+    if len(prefix) == 8 and prefix.isascii() and prefix.isdigit():
+        y, mo, day = int(prefix[:4]), int(prefix[4:6]), int(prefix[6:8])
+        if 1 <= mo <= 12 and 1 <= day <= 31:
+            return (y, mo, day)
+    return (0, 0, 0)
+
+
+def sort_key_for_dir(d):
+    """以資料夾名稱的 YYYYMMDD 前綴為優先排序鍵；無則用很早的日期（排到較後面），最後再以名稱排序。
+
+    鍵為 (年, 月, 日, 名稱) 的整數 tuple。
+    """
+    n = d.name
+    return (*_parse_ymd_prefix(n[:8]), n)
+
+
+def _load_cache(root: Path) -> dict:
+    """讀取 {相對路徑: [mtime_ns, 圖片檔名, 是否有 _index.html]}；格式不符或設定變更則視為空。"""
+    if not CACHE_FILE:
+        return {}
+    try:
+        data = json.loads((root / CACHE_FILE).read_bytes())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("key") != [IMAGE_BASENAME, list(IMAGE_EXTS)]:
+        return {}
+    dirs = data.get("dirs")
+    return dirs if isinstance(dirs, dict) else {}
 
 
-def sort_key_for_dir(d: Path):
-    """以資料夾名稱的 YYYYMMDD 前綴為優先排序鍵；無則用很早的日期，最後再以名稱排序。"""
-    m = _date_re.match(d.name)
-    if m:
-        ymd = m.group(1)
-        try:
-            dt = _dt.datetime.strptime(ymd, "%Y%m%d").date()
-            return (dt, d.name)
-        except ValueError:
-            pass
-    # 非日期開頭 → 排到較後面
-    return (_dt.date(1900, 1, 1), d.name)
+def _save_cache(root: Path, dirs: dict):
+    data = {"key": [IMAGE_BASENAME, list(IMAGE_EXTS)], "dirs": dirs}
+    _atomic_write_bytes(root / CACHE_FILE, json.dumps(data, ensure_ascii=False).encode("utf-8"))
 
 
 def collect_entries(root: Path):
     """回傳 [{name, img, href}] 列表。img/href 皆為相對於 root 的 POSIX 路徑字串。"""
     if ONLY_IMMEDIATE_CHILDREN:
-        candidates = [p for p in root.iterdir() if p.is_dir()]
+        candidates = list(_iter_subdirs(root))
     else:
-        candidates = [p for p in root.rglob("*") if p.is_dir() and p != root]
+        candidates = list(_all_subdirs(root))
 
-    # 排除特定前綴資料夾
-    candidates = [d for d in candidates if not d.name.startswith(EXCLUDE_DIR_PREFIXES)]
-
-    # 依日期前綴排序
+    # 依日期前綴排序（sort 的 key 對每個元素只計算一次）
     candidates.sort(key=sort_key_for_dir, reverse=SORT_DESC)
 
-    items = []
+    cache = _load_cache(root)
+    # 先決定每個資料夾的相對路徑與快取結果，未命中的才需要實際掃描
+    rels = []
+    mtimes = []
+    results = []
+    misses = []
     for d in candidates:
-        img = find_title_image(d)
-        if not img:
+        # 轉成相對於 root 的 POSIX 路徑（適合放在 JSON/HTML）；
+        # 第一層子資料夾直接用名稱組字串，只有遞迴掃描才需要 relative_to
+        rel = d.name if ONLY_IMMEDIATE_CHILDREN else Path(d).relative_to(root).as_posix()
+        rels.append(rel)
+        if CACHE_FILE:
+            # 資料夾內新增/刪除/改名檔案都會更新其 mtime；沒變就沿用上次結果。
+            # 跟隨符號連結，取實際被掃描的資料夾的 mtime
+            mtime_ns = os.stat(d).st_mtime_ns
+            mtimes.append(mtime_ns)
+            hit = cache.get(rel)
+            if isinstance(hit, list) and len(hit) == 3 and hit[0] == mtime_ns:
+                results.append((hit[1], hit[2]))
+                continue
+        results.append(None)
+        misses.append(len(results) - 1)
+
+    # 掃描屬 IO（scandir 會釋放 GIL），資料夾多時用執行緒池重疊等待時間
+    paths = [os.fspath(candidates[i]) for i in misses]
+    if len(paths) >= PARALLEL_MIN_DIRS:
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4)) as ex:
+            probed = list(ex.map(find_title_image, paths))
+    else:
+        probed = [find_title_image(p) for p in paths]
+    for i, res in zip(misses, probed):
+        results[i] = res
+    if CACHE_FILE:
+        new_cache = {rel: [m, *res] for rel, m, res in zip(rels, mtimes, results)}
+        if new_cache != cache:
+            _save_cache(root, new_cache)
+
+    items = []
+    for d, rel, (img_name, has_index) in zip(candidates, rels, results):
+        if not img_name:
             continue
-        href_path = link_target(d)
-        # 轉成相對於 root 的 POSIX 路徑（適合放在 JSON/HTML）
-        img_rel = img.relative_to(root).as_posix()
-        href_rel = href_path.relative_to(root).as_posix()
-        # 如果是資料夾本身，補上尾斜線，瀏覽器顯示會更穩定
-        if href_path.is_dir() and not href_rel.endswith("/"):
-            href_rel += "/"
+        img_rel = f"{rel}/{img_name}"
+        # 優先連到 _index.html；若不存在，連到資料夾本身（補上尾斜線，瀏覽器顯示會更穩定）
+        href_rel = f"{rel}/_index.html" if has_index else f"{rel}/"
 
         items.append({
             "name": d.name,
@@ -106,77 +204,148 @@ def collect_entries(root: Path):
     return items
 
 
-HTML_TEMPLATE = f"""<!doctype html>
+_CSS = """\
+  body{margin:0;background:#101012;color:#eee;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto}
+  header{padding:16px 12px;border-bottom:1px solid #26262b;position:sticky;top:0;background:#101012cc;backdrop-filter:blur(6px)}
+  h1{margin:0;font-size:18px}
+  .muted{color:#a1a1aa;font-size:12px}
+  .grid{display:grid;gap:14px;padding:16px;grid-template-columns:repeat(auto-fit,minmax(220px,1fr));max-width:1200px;margin:0 auto}
+  .card{display:block;background:#19191e;border:1px solid #26262b;border-radius:14px;overflow:hidden;text-decoration:none;color:inherit}
+  .card img{display:block;width:100%;aspect-ratio:16/9;object-fit:cover;background:#0f0f12}
+  .card span{display:block;padding:10px 12px;font-size:14px;border-top:1px solid #26262b;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}
+"""
+
+
+HTML_TEMPLATE = """<!doctype html>
 <html lang="zh-Hant">
 <head>
 <meta charset="utf-8">
 <meta name="viewport" content="width=device-width,initial-scale=1">
-<title>{PAGE_TITLE}</title>
+<title>$PAGE_TITLE</title>
 <style>
-  body{{margin:0;background:#101012;color:#eee;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto}}
-  header{{padding:16px 12px;border-bottom:1px solid #26262b;position:sticky;top:0;background:#101012cc;backdrop-filter:blur(6px)}}
-  h1{{margin:0;font-size:18px}}
-  .muted{{color:#a1a1aa;font-size:12px}}
-  .grid{{display:grid;gap:14px;padding:16px;grid-template-columns:repeat(auto-fit,minmax(220px,1fr));max-width:1200px;margin:0 auto}}
-  .card{{display:block;background:#19191e;border:1px solid #26262b;border-radius:14px;overflow:hidden;text-decoration:none;color:inherit}}
-  .card img{{display:block;width:100%;aspect-ratio:16/9;object-fit:cover;background:#0f0f12}}
-  .card span{{display:block;padding:10px 12px;font-size:14px;border-top:1px solid #26262b;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}}
-</style>
+$CSS</style>
 </head>
 <body>
 <header>
-  <h1>{SITE_HEADER}</h1>
-  <div class="muted">{SITE_SUB}</div>
+  <h1>$SITE_HEADER</h1>
+  <div class="muted">$SITE_SUB</div>
 </header>
 
 <main class="grid" id="grid"></main>
 
 <script>
-(async () => {{
+(async () => {
   const grid = document.getElementById('grid');
-  const url = new URL('./{OUTPUT_JSON}', location.href);
+  // 逐段編碼路徑（保留 /），資料夾名稱含 # ? % 也能正確連結
+  const encodePath = p => p.split('/').map(encodeURIComponent).join('/');
+  const escapeHtml = s => String(s).replace(/[&<>"']/g, c => ({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+  })[c]);
+  const url = new URL('./$OUTPUT_JSON', location.href);
   // 破快取參數
   url.searchParams.set('v', Date.now());
   let items = [];
-  try {{
-    const r = await fetch(url.toString(), {{ cache: 'no-store' }});
+  try {
+    const r = await fetch(url.toString(), { cache: 'no-store' });
     if (!r.ok) throw new Error('HTTP ' + r.status);
     items = await r.json();
-  }} catch (err) {{
+  } catch (err) {
     grid.innerHTML = '<p style="color:#f88">載入資料失敗：' + (err && err.message || err) + '</p>';
     return;
-  }}
-  if (!Array.isArray(items) || items.length === 0) {{
+  }
+  if (!Array.isArray(items) || items.length === 0) {
     grid.innerHTML = '<p class="muted">目前沒有可顯示的項目（確認資料夾內有 title.jpg / _index.html）。</p>';
     return;
-  }}
-  grid.innerHTML = '';
-  for (const it of items) {{
-    const a = document.createElement('a');
-    a.className = 'card';
-    a.href = it.href;
-    a.innerHTML = `
-      <img src="${{it.img}}" alt="${{it.name}}">
-      <span>${{it.name}}</span>
-    `;
-    grid.appendChild(a);
-  }}
-}})();
+  }
+  // 一次組好全部卡片再寫入 DOM，只觸發一次版面重排
+  grid.innerHTML = items.map(it => {
+    const name = escapeHtml(it.name);
+    return `<a class="card" href="$${encodePath(it.href)}"><img src="$${encodePath(it.img)}" alt="$${name}" loading="lazy"><span>$${name}</span></a>`;
+  }).join('');
+})();
 </script>
 </body>
 </html>
 """
 
 
+STANDALONE_HTML_TEMPLATE = """<!doctype html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<title>$PAGE_TITLE</title>
+<style>
+$CSS</style>
+</head>
+<body>
+<header>
+  <h1>$SITE_HEADER</h1>
+  <div class="muted">$SITE_SUB</div>
+</header>
+
+<main class="grid">
+$CARDS</main>
+</body>
+</html>
+"""
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    """先寫到同目錄的暫存檔再 os.replace，避免中途失敗留下只寫一半的檔案。"""
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
 def write_json(items):
-    ROOT.joinpath(OUTPUT_JSON).write_text(
-        json.dumps(items, ensure_ascii=False, indent=2),
-        encoding="utf-8"
+    # 機器產生、給 fetch 讀的檔案，不縮排以縮小體積
+    if orjson is not None:
+        data = orjson.dumps(items)
+    else:
+        data = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _atomic_write_bytes(ROOT / OUTPUT_JSON, data)
+    if WRITE_JSON_GZIP:
+        # mtime=0 讓內容不變時輸出也相同，避免無意義的 git 差異
+        _atomic_write_bytes(ROOT / f"{OUTPUT_JSON}.gz", gzip.compress(data, compresslevel=6, mtime=0))
+
+
+def render_html(template: str, **extra) -> str:
+    """在輸出時才代入設定值（模板是一般字串，JS/CSS 的大括號不需跳脫，$ 需寫成 $$）。"""
+    return Template(template).substitute(
+        PAGE_TITLE=PAGE_TITLE,
+        SITE_HEADER=SITE_HEADER,
+        SITE_SUB=SITE_SUB,
+        OUTPUT_JSON=OUTPUT_JSON,
+        CSS=_CSS,
+        **extra,
     )
 
 
 def write_html():
-    ROOT.joinpath(OUTPUT_HTML).write_text(HTML_TEMPLATE, encoding="utf-8")
+    _atomic_write_bytes(ROOT / OUTPUT_HTML, render_html(HTML_TEMPLATE).encode("utf-8"))
+
+
+def build_cards(items):
+    """把 collect_entries 的結果轉成卡片 HTML（與 index.html 的 JS 版相同結構）。"""
+    buf = []
+    append = buf.append
+    for it in items:
+        # 名稱做 HTML 跳脫、路徑做 URL 編碼（保留 /），每筆只算一次
+        name = escape(it["name"])
+        href = quote(it["href"], safe="/")
+        img = quote(it["img"], safe="/")
+        append(f'<a class="card" href="{href}"><img src="{img}" alt="{name}" loading="lazy"><span>{name}</span></a>\n')
+    return "".join(buf)
+
+
+def write_standalone_html(items):
+    html = render_html(STANDALONE_HTML_TEMPLATE, CARDS=build_cards(items))
+    _atomic_write_bytes(ROOT / OUTPUT_STANDALONE_HTML, html.encode("utf-8"))
 
 
 def ensure_nojekyll():
@@ -186,15 +355,37 @@ def ensure_nojekyll():
             p.write_text("", encoding="utf-8")
 
 
+def open_in_browser(url: str):
+    """以背景程序開啟瀏覽器，不等待其結束（webbrowser 模組可能因探測瀏覽器而卡住）。"""
+    if os.name == "nt":
+        os.startfile(url)
+        return
+    import subprocess  # 只有真的要開瀏覽器時才載入
+
+    cmd = "open" if sys.platform == "darwin" else "xdg-open"
+    subprocess.Popen(
+        [cmd, url],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
 def main():
     items = collect_entries(ROOT)
     write_json(items)
     write_html()
+    if OUTPUT_STANDALONE_HTML:
+        write_standalone_html(items)
     ensure_nojekyll()
     print(f"✅ 已生成 {OUTPUT_JSON}（{len(items)} 筆）與 {OUTPUT_HTML}")
-    if AUTO_OPEN_AFTER_BUILD:
+    if OUTPUT_STANDALONE_HTML:
+        print(f"✅ 已生成 {OUTPUT_STANDALONE_HTML}")
+    # 只在互動終端機下開瀏覽器（CI、排程、git hook 不需要）；pythonw 下 sys.stdout 為 None
+    if AUTO_OPEN_AFTER_BUILD and sys.stdout is not None and sys.stdout.isatty():
         try:
-            webbrowser.open_new_tab((ROOT / OUTPUT_HTML).as_uri())
+            open_in_browser((ROOT / OUTPUT_HTML).as_uri())
         except Exception:
             pass
 